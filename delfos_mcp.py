@@ -3,31 +3,391 @@ Delfos MCP Server Configuration
 This module sets up the FastMCP server for Delfos SQL database interactions.
 """
 
+import asyncio
+import functools
+import io
 import os
 import pyodbc
 from dotenv import load_dotenv
 from mcp.server.fastmcp import FastMCP
 import logging
+import queue
+import re
+import threading
+import time
 import uuid
-from datetime import datetime
+from contextlib import contextmanager
 from typing import List, Dict
+from urllib.parse import quote, urlencode
 
 # Load environment variables
 load_dotenv()
 
+# Disable pyodbc's process-wide pooling: it is unreliable with unixODBC
+# against Azure SQL (leaked connections) and its driver-manager global lock
+# serializes concurrent connects. The application-level pool below keeps
+# connection lifetime and health explicit instead. Must be set before the
+# first connect.
+pyodbc.pooling = False
+
 # Initialize FastMCP server
 mcp = FastMCP("delfos-sql", stateless_http=True)
 
 # Constants
 CONNECTION_STRING = os.getenv("DB_CONNECTION_STRING")
 
+# Power BI report configuration, resolved once at import time.
+WORKSPACE_ID = os.getenv("WORKSPACE_ID")
+REPORT_ID = os.getenv("REPORT_ID")
+POWERBI_URL_PREFIX = f"https://app.powerbi.com/groups/{WORKSPACE_ID}/reports/{REPORT_ID}"
+
+VISUAL_PAGE_MAP = {
+    "linea": "Line",
+    "barras": "Bar",
+    "barras_agrupadas": "StackedBar",
+    "pie": "PieChart",
+}
+
+@functools.lru_cache(maxsize=1024)
+def _build_powerbi_url(run_id: str, visual_hint: str) -> str:
+    """Build (and memoize) the filtered report URL for a run/visual pair."""
+    page_name = VISUAL_PAGE_MAP.get(visual_hint, "ReportSectionBarras")
+    # Power BI's URL-filter syntax expects %20 for spaces and a literal slash
+    # in Table/Field; quote_via=quote avoids urlencode's default + and %2F.
+    query = urlencode(
+        {
+            "pageName": page_name,
+            "filter": f"agent_output/run_id eq '{run_id}'",
+        },
+        quote_via=quote,
+        safe="/",
+    )
+    return f"{POWERBI_URL_PREFIX}?{query}"
+
+# Batches above this size are sent as a table-valued parameter instead of
+# executemany, which degrades as the parameter count grows.
+TVP_THRESHOLD = 500
+
+# created_at is omitted: the column defaults to SYSUTCDATETIME() server-side
+# (see infra/sql), which stamps every row in a batch with the same clock and
+# saves a parameter bind per row.
+AGENT_OUTPUT_INSERT_SQL = """
+    INSERT INTO [dbo].[agent_output]
+        ([run_id], [user_id], [question], [x_value], [y_value],
+         [series], [category], [metric_name], [visual_hint])
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Per-row keys read from each results dict, in insert-column order.
+AGENT_OUTPUT_RESULT_FIELDS = ("x_value", "y_value", "series", "category")
+
 ################################
 # DATABASE CONNECTION
 ################################
 
-def get_db_connection() -> pyodbc.Connection:
-    """Establish and return a connection to the Azure SQL Database."""
-    return pyodbc.connect(CONNECTION_STRING)
+POOL_SIZE = 10
+POOL_IDLE_TIMEOUT = 300  # seconds before an idle pooled connection is closed
+_POOL_PRUNE_INTERVAL = 60
+
+# Pool of (connection, last_used_timestamp) pairs, newest at the back.
+_pool: "queue.Queue" = queue.Queue(maxsize=POOL_SIZE)
+# Caps connections checked out at once; a burst beyond POOL_SIZE waits here
+# instead of opening surplus connections that would be closed on return.
+_pool_slots = threading.BoundedSemaphore(POOL_SIZE)
+_pruner_started = threading.Event()
+
+def _open_connection() -> pyodbc.Connection:
+    """Open a fresh connection to the Azure SQL Database."""
+    return pyodbc.connect(CONNECTION_STRING, autocommit=False)
+
+def _prune_idle_connections():
+    """Periodically close pooled connections idle for longer than POOL_IDLE_TIMEOUT."""
+    while True:
+        time.sleep(_POOL_PRUNE_INTERVAL)
+        now = time.monotonic()
+        keep = []
+        while True:
+            try:
+                conn, last_used = _pool.get_nowait()
+            except queue.Empty:
+                break
+            if now - last_used > POOL_IDLE_TIMEOUT:
+                try:
+                    conn.close()
+                except pyodbc.Error:
+                    pass
+            else:
+                keep.append((conn, last_used))
+        for item in keep:
+            try:
+                _pool.put_nowait(item)
+            except queue.Full:
+                try:
+                    item[0].close()
+                except pyodbc.Error:
+                    pass
+
+def _ensure_pruner():
+    if not _pruner_started.is_set():
+        _pruner_started.set()
+        threading.Thread(target=_prune_idle_connections, daemon=True).start()
+
+@contextmanager
+def acquire_conn():
+    """
+    Context manager yielding a pooled database connection.
+
+    Reuses a warm connection when one is available (skipping the TCP/TLS/auth
+    handshake), otherwise opens a new one, with at most POOL_SIZE connections
+    checked out at once. The connection is returned to the pool on clean exit
+    and discarded if the block raised.
+    """
+    _ensure_pruner()
+    _pool_slots.acquire()
+    try:
+        try:
+            conn, _ = _pool.get_nowait()
+        except queue.Empty:
+            conn = _open_connection()
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.close()
+            except pyodbc.Error:
+                pass
+            raise
+        else:
+            try:
+                _pool.put_nowait((conn, time.monotonic()))
+            except queue.Full:
+                conn.close()
+    finally:
+        _pool_slots.release()
+
+def _insert_cursor(conn: pyodbc.Connection) -> pyodbc.Cursor:
+    """
+    Return a long-lived insert cursor for this pooled connection.
+
+    Keeping one cursor per connection means pyodbc sees the same INSERT text
+    on the same cursor across batches and auto-prepares it, skipping the
+    server-side parse/bind on every call after the first.
+    """
+    cursor = getattr(conn, "_insert_cursor", None)
+    if cursor is None:
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        conn._insert_cursor = cursor
+    return cursor
+
+def _fetch_sync(sql: str, params=None, one: bool = False):
+    """
+    Run a query on a pooled connection and return the fetched rows.
+
+    Only the execute/fetch happens while the connection is checked out;
+    callers stringify the rows after it is back in the pool, so formatting
+    cost never extends the checkout under concurrent load.
+    """
+    with acquire_conn() as conn:
+        cursor = conn.cursor()
+        if params is None:
+            cursor.execute(sql)
+        else:
+            cursor.execute(sql, params)
+        rows = cursor.fetchone() if one else cursor.fetchall()
+        cursor.close()
+        # Pool connections run with autocommit off, so even a SELECT opens an
+        # implicit transaction; end it before the connection goes back to the
+        # pool rather than leaving the session sleeping inside one.
+        conn.rollback()
+    return rows
+
+async def fetch(sql: str, params=None, one: bool = False):
+    """
+    Execute a blocking pyodbc query in a worker thread.
+
+    The tools are async but pyodbc is not; running the query via
+    asyncio.to_thread keeps the FastMCP event loop free so concurrent
+    requests overlap at the database instead of serializing.
+    """
+    return await asyncio.to_thread(_fetch_sync, sql, params, one)
+
+FETCH_CHUNK_SIZE = 1000  # rows fetched per SQLFetch batch when streaming results
+
+MAX_UNBOUNDED_ROWS = 1000  # TOP cap injected into SELECTs with no explicit limit
+
+_SELECT_HEAD_RE = re.compile(r"^(\s*SELECT\s+(?:DISTINCT\s+|ALL\s+)?)", re.IGNORECASE)
+_HAS_LIMIT_RE = re.compile(r"\b(?:TOP\s*\(?\s*\d|OFFSET\s+\d+\s+ROWS?|FETCH\s+(?:FIRST|NEXT))\b", re.IGNORECASE)
+_SET_OP_RE = re.compile(r"\b(?:UNION|INTERSECT|EXCEPT)\b", re.IGNORECASE)
+
+def _apply_row_limit(sql: str):
+    """
+    Inject TOP MAX_UNBOUNDED_ROWS into a bare SELECT.
+
+    Returns (sql, True) when a cap was added, or the query untouched when it
+    is not a SELECT, already carries its own TOP/OFFSET/FETCH limit, or uses
+    a set operation — injecting TOP there would cap only the first branch and
+    silently change its semantics without bounding the overall result.
+    """
+    head = _SELECT_HEAD_RE.match(sql)
+    if head is None or _HAS_LIMIT_RE.search(sql) or _SET_OP_RE.search(sql):
+        return sql, False
+    return f"{head.group(1)}TOP {MAX_UNBOUNDED_ROWS} {sql[head.end():]}", True
+
+def _stream_query_sync(sql: str) -> str:
+    """
+    Execute a query and stringify its rows chunk by chunk.
+
+    Fetching FETCH_CHUNK_SIZE rows at a time into a StringIO keeps memory
+    O(chunk) instead of materializing the whole result set twice (rows plus
+    joined string), and the matching arraysize lets the driver prefetch in
+    the same sized batches.
+    """
+    buf = io.StringIO()
+    with acquire_conn() as conn:
+        cursor = conn.cursor()
+        cursor.arraysize = FETCH_CHUNK_SIZE
+        cursor.execute(sql)
+        if cursor.description is None:
+            # No result set (INSERT/UPDATE/DELETE/DDL): fetching would raise,
+            # so just commit and report the affected rowcount.
+            rowcount = cursor.rowcount
+            cursor.close()
+            conn.commit()
+            return f"Statement executed successfully. {rowcount} rows affected."
+        rows = cursor.fetchmany(FETCH_CHUNK_SIZE)
+        while rows:
+            buf.writelines(f"{row}\n" for row in rows)
+            rows = cursor.fetchmany(FETCH_CHUNK_SIZE)
+        cursor.close()
+        # Close the implicit transaction before the connection returns to the
+        # pool; commit rather than rollback because execute_sql_query accepts
+        # arbitrary statements, not just SELECTs.
+        conn.commit()
+    return buf.getvalue()
+
+WRITE_BATCH_MAX_ROWS = 1000  # max rows coalesced into one background insert
+WRITE_COALESCE_WINDOW = 0.05  # seconds to wait for more batches before writing
+
+# Queue of parameter-row lists awaiting the background writer; created lazily
+# on the event loop by the first insert call.
+_write_queue = None
+_writer_task = None
+
+def _insert_rows_sync(params: List[tuple]):
+    """Insert pre-built parameter rows into agent_output in one transaction."""
+    if not params:
+        # executemany rejects an empty parameter list; nothing to write anyway.
+        return
+    with acquire_conn() as conn:
+        # One transaction for the whole batch: a single log flush on commit
+        # instead of one per statement under autocommit.
+        conn.autocommit = False
+        cursor = _insert_cursor(conn)
+        try:
+            if len(params) > TVP_THRESHOLD:
+                # Large batches hit fast_executemany's parameter-count scaling
+                # wall; hand the whole set to the server as one table-valued
+                # parameter (requires dbo.AgentOutputRow +
+                # dbo.usp_insert_agent_output_batch, see infra/sql).
+                cursor.execute("{CALL dbo.usp_insert_agent_output_batch (?)}", (params,))
+            else:
+                # Pack all rows into a single RPC batch instead of one
+                # roundtrip per row.
+                cursor.executemany(AGENT_OUTPUT_INSERT_SQL, params)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+async def _agent_output_writer():
+    """
+    Drain the write queue, coalescing concurrent inserts into one batch.
+
+    Waits up to WRITE_COALESCE_WINDOW for additional queued batches (capped
+    at WRITE_BATCH_MAX_ROWS) so bursts of small inserts land as a single
+    executemany/TVP call instead of one transaction each.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        params = list(await _write_queue.get())
+        pending = 1
+        deadline = loop.time() + WRITE_COALESCE_WINDOW
+        while len(params) < WRITE_BATCH_MAX_ROWS:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                more = await asyncio.wait_for(_write_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            params.extend(more)
+            pending += 1
+        try:
+            await asyncio.to_thread(_insert_rows_sync, params)
+        except Exception as e:
+            logging.error(f"Background agent_output insert failed: {e}")
+        finally:
+            for _ in range(pending):
+                _write_queue.task_done()
+
+def _ensure_writer():
+    global _write_queue, _writer_task
+    if _writer_task is None:
+        _write_queue = asyncio.Queue()
+        _writer_task = asyncio.ensure_future(_agent_output_writer())
+
+QUERY_CACHE_TTL = 30  # seconds; agents frequently re-issue identical SELECTs
+QUERY_CACHE_MAXSIZE = 512
+
+# Stripped SELECT text -> (expires_at, result). Keys are the exact query
+# text: lowercasing or collapsing whitespace would also rewrite string
+# literals and alias distinct queries. Insertion-ordered, so the first key
+# is always the oldest entry and eviction is O(1).
+_query_cache: dict = {}
+
+def _query_cache_get(key: str):
+    entry = _query_cache.get(key)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+def _query_cache_put(key: str, result: str):
+    if len(_query_cache) >= QUERY_CACHE_MAXSIZE:
+        _query_cache.pop(next(iter(_query_cache)))
+    _query_cache[key] = (time.monotonic() + QUERY_CACHE_TTL, result)
+
+METADATA_CACHE_TTL = 60  # seconds; schema metadata is near-static
+
+def async_debounce(ttl: float = METADATA_CACHE_TTL):
+    """
+    TTL cache for async functions that also coalesces in-flight calls.
+
+    Results are cached per argument tuple for `ttl` seconds, and concurrent
+    callers with the same arguments await the same in-flight task instead of
+    each hitting the database. Failed calls are evicted so they get retried.
+    """
+    def decorator(func):
+        cache: dict = {}
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+            entry = cache.get(key)
+            if entry is not None and entry[0] > now:
+                return await asyncio.shield(entry[1])
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            cache[key] = (now + ttl, task)
+            try:
+                return await asyncio.shield(task)
+            except Exception:
+                cache.pop(key, None)
+                raise
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
 
 ################################
 # MCP TOOLS
@@ -37,24 +397,46 @@ def get_db_connection() -> pyodbc.Connection:
 async def execute_sql_query(query: str) -> str:
     """
     Execute a SQL query against the Delfos database and return the results.
-    
+
+    Bare SELECTs (no TOP/OFFSET/FETCH) are capped at TOP 1000 server-side to
+    keep the transferred result bounded; a note is appended when that happens.
+    SELECT results are cached for a short TTL so repeated identical reads
+    skip the database; any write statement invalidates the cache.
+
     Args:
         query (str): The SQL query to execute.
     Returns:
         str: The results of the SQL query.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(query)
-    results = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    
-    result_str = "\n".join([str(row) for row in results])
-    return result_str if result_str else "No results found."
+    is_select = _SELECT_HEAD_RE.match(query) is not None
+    cache_key = query.strip()
+    if is_select:
+        cached = _query_cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+    query, limited = _apply_row_limit(query)
+    result_str = await asyncio.to_thread(_stream_query_sync, query)
+    if not result_str:
+        result_str = "No results found."
+    else:
+        result_str = result_str.rstrip("\n")
+        if limited:
+            result_str += (
+                f"\n\n[Results capped at {MAX_UNBOUNDED_ROWS} rows;"
+                " add an explicit TOP or OFFSET/FETCH clause for more.]"
+            )
 
+    if is_select:
+        _query_cache_put(cache_key, result_str)
+    else:
+        # A write may change what any cached SELECT would return.
+        _query_cache.clear()
+    return result_str
 
-@mcp.tool() 
+
+@mcp.tool()
+@async_debounce()
 async def get_table_schema(table_name: str) -> str:
     """
     Retrieve the schema of a specified table in the Delfos database.
@@ -64,20 +446,26 @@ async def get_table_schema(table_name: str) -> str:
     Returns:
         str: The schema of the specified table.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(f"SELECT COLUMN_NAME, DATA_TYPE FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = '{table_name}'")
-    columns = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    
-    if not columns:
+    # STRING_AGG concatenates server-side: one row comes back instead of one
+    # SQLFetch per column. The CAST to nvarchar(max) keeps the aggregate from
+    # hitting the 8000-byte limit of non-max input types.
+    row = await fetch(
+        """
+        SELECT STRING_AGG(CAST(CONCAT(COLUMN_NAME, ': ', DATA_TYPE) AS nvarchar(max)), CHAR(10))
+            WITHIN GROUP (ORDER BY ORDINAL_POSITION)
+        FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = ?
+        """,
+        (table_name,),
+        one=True
+    )
+
+    schema_str = row[0]
+    if not schema_str:
         return f"No schema found for table '{table_name}'."
-    
-    schema_str = "\n".join([f"{col.COLUMN_NAME}: {col.DATA_TYPE}" for col in columns])
     return schema_str
 
 @mcp.tool()
+@async_debounce()
 async def list_tables() -> str:
     """
     List all tables in the Delfos database.
@@ -85,17 +473,15 @@ async def list_tables() -> str:
     Returns:
         str: A list of all table names in the database.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT TABLE_NAME FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_TYPE = 'BASE TABLE'")
-    tables = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    
-    table_list = [table.TABLE_NAME for table in tables]
-    return "\n".join(table_list) if table_list else "No tables found in the database."
+    row = await fetch(
+        "SELECT STRING_AGG(CAST(TABLE_NAME AS nvarchar(max)), CHAR(10)) FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_TYPE = 'BASE TABLE'",
+        one=True
+    )
+
+    return row[0] if row[0] else "No tables found in the database."
 
 @mcp.tool()
+@async_debounce()
 async def get_database_info() -> str:
     """
     Retrieve general information about the Delfos database.
@@ -103,13 +489,8 @@ async def get_database_info() -> str:
     Returns:
         str: General information about the database.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT DB_NAME() AS DatabaseName, SERVERPROPERTY('ProductVersion') AS Version")
-    info = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    
+    info = await fetch("SELECT DB_NAME() AS DatabaseName, SERVERPROPERTY('ProductVersion') AS Version", one=True)
+
     return f"Database Name: {info.DatabaseName}\nVersion: {info.Version}"
 
 @mcp.tool()
@@ -122,16 +503,19 @@ async def get_table_row_count(table_name: str) -> str:
     Returns:
         str: The number of rows in the specified table.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(f"SELECT COUNT(*) AS TotalRows FROM [SalesLT].[{table_name}]")
-    row_count = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    
+    row_count = await fetch(
+        """
+        DECLARE @sql nvarchar(max) = N'SELECT COUNT(*) AS TotalRows FROM [SalesLT].' + QUOTENAME(?);
+        EXEC sp_executesql @sql;
+        """,
+        (table_name,),
+        one=True
+    )
+
     return f"Table '{table_name}' has {row_count.TotalRows} rows."
 
 @mcp.tool()
+@async_debounce()
 async def get_primary_keys(table_name: str) -> str:
     """
     Retrieve the primary keys of a specified table.
@@ -141,23 +525,21 @@ async def get_primary_keys(table_name: str) -> str:
     Returns:
         str: The primary keys of the specified table.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(f"""
-        SELECT COLUMN_NAME 
-        FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE 
-        WHERE OBJECTPROPERTY(OBJECT_ID(CONSTRAINT_SCHEMA + '.' + CONSTRAINT_NAME), 'IsPrimaryKey') = 1 
-        AND TABLE_NAME = '{table_name}'
-    """)
-    keys = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    
-    if not keys:
+    row = await fetch(
+        """
+        SELECT STRING_AGG(CAST(COLUMN_NAME AS nvarchar(max)), ', ')
+            WITHIN GROUP (ORDER BY ORDINAL_POSITION)
+        FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE
+        WHERE OBJECTPROPERTY(OBJECT_ID(CONSTRAINT_SCHEMA + '.' + CONSTRAINT_NAME), 'IsPrimaryKey') = 1
+        AND TABLE_NAME = ?
+        """,
+        (table_name,),
+        one=True
+    )
+
+    if not row[0]:
         return f"No primary keys found for table '{table_name}'."
-    
-    key_list = [key.COLUMN_NAME for key in keys]
-    return ", ".join(key_list)
+    return row[0]
 
 @mcp.tool()
 async def get_distinct_values(table_name: str, column_name: str) -> str:
@@ -170,20 +552,91 @@ async def get_distinct_values(table_name: str, column_name: str) -> str:
     Returns:
         str: Distinct values from the specified column.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(f"SELECT DISTINCT [{column_name}] FROM [SalesLT].[{table_name}]")
-    values = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    
-    if not values:
+    row = await fetch(
+        """
+        DECLARE @sql nvarchar(max) =
+            N'SELECT STRING_AGG(CAST(v AS nvarchar(max)), CHAR(10))'
+            + N' FROM (SELECT DISTINCT ' + QUOTENAME(?) + N' AS v FROM [SalesLT].' + QUOTENAME(?) + N') d';
+        EXEC sp_executesql @sql;
+        """,
+        (column_name, table_name),
+        one=True
+    )
+
+    if not row[0]:
         return f"No distinct values found in column '{column_name}' of table '{table_name}'."
-    
-    value_list = [str(value[0]) for value in values]
-    return "\n".join(value_list)
+    return row[0]
 
 @mcp.tool()
+@async_debounce()
+async def get_full_schema() -> str:
+    """
+    Retrieve the full database schema in one call: every table with its
+    columns, primary keys, and foreign key relationships.
+
+    Agents typically chain list_tables -> get_table_schema ->
+    get_primary_keys per table; this tool answers all of that in a single
+    roundtrip (plus one for foreign keys) instead of N+1.
+
+    Returns:
+        str: A per-table dump of columns (with PK markers) and foreign keys.
+    """
+    columns = await fetch("""
+        SELECT
+            t.TABLE_NAME,
+            c.COLUMN_NAME,
+            c.DATA_TYPE,
+            CASE WHEN k.COLUMN_NAME IS NOT NULL THEN 1 ELSE 0 END AS IsPrimaryKey
+        FROM INFORMATION_SCHEMA.TABLES t
+        LEFT JOIN INFORMATION_SCHEMA.COLUMNS c
+            ON c.TABLE_NAME = t.TABLE_NAME AND c.TABLE_SCHEMA = t.TABLE_SCHEMA
+        LEFT JOIN INFORMATION_SCHEMA.KEY_COLUMN_USAGE k
+            ON k.TABLE_NAME = c.TABLE_NAME AND k.TABLE_SCHEMA = c.TABLE_SCHEMA
+            AND k.COLUMN_NAME = c.COLUMN_NAME
+            AND OBJECTPROPERTY(OBJECT_ID(k.CONSTRAINT_SCHEMA + '.' + k.CONSTRAINT_NAME), 'IsPrimaryKey') = 1
+        WHERE t.TABLE_TYPE = 'BASE TABLE'
+        ORDER BY t.TABLE_NAME, c.ORDINAL_POSITION
+    """)
+    foreign_keys = await fetch("""
+        SELECT
+            tp.name AS ParentTable,
+            cp.name AS ParentColumn,
+            tr.name AS ReferencedTable,
+            cr.name AS ReferencedColumn
+        FROM
+            sys.foreign_keys AS fk
+        INNER JOIN
+            sys.foreign_key_columns AS fkc ON fk.object_id = fkc.constraint_object_id
+        INNER JOIN
+            sys.tables AS tp ON fkc.parent_object_id = tp.object_id
+        INNER JOIN
+            sys.columns AS cp ON fkc.parent_object_id = cp.object_id AND fkc.parent_column_id = cp.column_id
+        INNER JOIN
+            sys.tables AS tr ON fkc.referenced_object_id = tr.object_id
+        INNER JOIN
+            sys.columns AS cr ON fkc.referenced_object_id = cr.object_id AND fkc.referenced_column_id = cr.column_id
+    """)
+
+    if not columns:
+        return "No tables found in the database."
+
+    tables: Dict[str, List[str]] = {}
+    for table_name, column_name, data_type, is_pk in columns:
+        lines = tables.setdefault(table_name, [])
+        if column_name is not None:
+            pk = " [PK]" if is_pk else ""
+            lines.append(f"  {column_name}: {data_type}{pk}")
+
+    for parent_table, parent_column, ref_table, ref_column in foreign_keys:
+        tables.setdefault(parent_table, []).append(
+            f"  FK: {parent_column} -> {ref_table}({ref_column})"
+        )
+
+    sections = [f"Table: {name}\n" + "\n".join(lines) for name, lines in tables.items()]
+    return "\n\n".join(sections)
+
+@mcp.tool()
+@async_debounce()
 async def get_table_relationships() -> str:
     """
     Retrieve foreign key relationships between tables.
@@ -191,45 +644,64 @@ async def get_table_relationships() -> str:
     Returns:
         str: List of foreign key relationships in the database.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT 
+    relationships = await fetch("""
+        SELECT
             fk.name AS ForeignKey,
             tp.name AS ParentTable,
             cp.name AS ParentColumn,
             tr.name AS ReferencedTable,
             cr.name AS ReferencedColumn
-        FROM 
+        FROM
             sys.foreign_keys AS fk
-        INNER JOIN 
+        INNER JOIN
             sys.foreign_key_columns AS fkc ON fk.object_id = fkc.constraint_object_id
-        INNER JOIN 
+        INNER JOIN
             sys.tables AS tp ON fkc.parent_object_id = tp.object_id
-        INNER JOIN 
+        INNER JOIN
             sys.columns AS cp ON fkc.parent_object_id = cp.object_id AND fkc.parent_column_id = cp.column_id
-        INNER JOIN 
+        INNER JOIN
             sys.tables AS tr ON fkc.referenced_object_id = tr.object_id
-        INNER JOIN 
+        INNER JOIN
             sys.columns AS cr ON fkc.referenced_object_id = cr.object_id AND fkc.referenced_column_id = cr.column_id
     """)
-    relationships = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    
+
     if not relationships:
         return "No foreign key relationships found in the database."
     
-    rel_list = [
-        f"Foreign Key: {rel.ForeignKey}, {rel.ParentTable}({rel.ParentColumn}) -> {rel.ReferencedTable}({rel.ReferencedColumn})"
+    return "\n".join(
+        f"Foreign Key: {rel[0]}, {rel[1]}({rel[2]}) -> {rel[3]}({rel[4]})"
         for rel in relationships
-    ]
-    return "\n".join(rel_list)
+    )
 
 
 
 
 
+@mcp.tool()
+async def gather_metadata() -> str:
+    """
+    Fetch tables, relationships, and the full schema concurrently.
+
+    Runs list_tables, get_table_relationships, and get_full_schema via
+    asyncio.gather so each query hits the database on its own pooled
+    connection; total discovery time is the slowest query instead of the
+    sum of all three.
+
+    Returns:
+        str: The combined output of the three metadata tools.
+    """
+    tables, relationships, full_schema = await asyncio.gather(
+        list_tables(),
+        get_table_relationships(),
+        get_full_schema(),
+    )
+
+    return (
+        f"TABLES:\n{tables}\n\n"
+        f"RELATIONSHIPS:\n{relationships}\n\n"
+        f"SCHEMA:\n{full_schema}"
+    )
+
 @mcp.tool()
 async def insert_agent_output_batch(
     user_id: str,
@@ -240,7 +712,12 @@ async def insert_agent_output_batch(
 ) -> str:
     """
     Insert multiple rows of query results into agent_output table
-    
+
+    The rows are queued and written by a background task that coalesces
+    concurrent calls into one batched insert; the run_id is returned
+    immediately without waiting for the commit. Call flush_agent_output to
+    wait for durability.
+
     Args:
         user_id (str): User identifier/email.
         question (str): The natural language question asked by the user.
@@ -261,40 +738,39 @@ async def insert_agent_output_batch(
             {"x_value": "Canada", "y_value": 45678.90, "category": "Canada"}
         ]
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     run_id = str(uuid.uuid4())
-    created_at = datetime.now()
-    
-    query = """
-        INSERT INTO [dbo].[agent_output]
-            ([run_id], [user_id], [question], [x_value], [y_value],
-             [series], [category], [metric_name], [visual_hint], [created_at])
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """
-    
-    rows_inserted = 0
-    for row in results:
-        cursor.execute(query, (
+
+    if not results:
+        return f"Inserted 0 rows successfully. run_id: {run_id}"
+
+    params = [
+        (
             run_id,
             user_id,
             question,
-            row.get("x_value"),
-            row.get("y_value"),
-            row.get("series"),
-            row.get("category"),
+            *(row.get(field) for field in AGENT_OUTPUT_RESULT_FIELDS),
             metric_name,
-            visual_hint,
-            created_at
-        ))
-        rows_inserted += 1
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
-    
-    return f"Inserted {rows_inserted} rows successfully. run_id: {run_id}"
+            visual_hint
+        )
+        for row in results
+    ]
+
+    _ensure_writer()
+    await _write_queue.put(params)
+
+    return f"Queued {len(results)} rows for insert. run_id: {run_id}"
+
+@mcp.tool()
+async def flush_agent_output() -> str:
+    """
+    Wait until all queued agent_output inserts have been written.
+
+    Returns:
+        str: Confirmation that the write queue is drained.
+    """
+    if _write_queue is not None:
+        await _write_queue.join()
+    return "All queued agent_output writes are flushed."
 
 @mcp.tool()
 async def generate_powerbi_url(run_id: str, visual_hint: str) -> str:
@@ -306,25 +782,7 @@ async def generate_powerbi_url(run_id: str, visual_hint: str) -> str:
     Returns:
         str: The generated Power BI report URL.
     """
-    WORKSPACE_ID = os.getenv("WORKSPACE_ID")
-    REPORT_ID    = os.getenv("REPORT_ID")
- 
-    VISUAL_PAGE_MAP = {
-        "linea": "Line",
-        "barras": "Bar",
-        "barras_agrupadas": "StackedBar",
-        "pie": "PieChart",
-    }
- 
-    page_name = VISUAL_PAGE_MAP.get(visual_hint, "ReportSectionBarras")
- 
-    url = (
-        f"https://app.powerbi.com/groups/{WORKSPACE_ID}/reports/{REPORT_ID}"
-        f"?pageName={page_name}"
-        f"&filter=agent_output/run_id%20eq%20'{run_id}'"
-    )
- 
-    return url
+    return _build_powerbi_url(run_id, visual_hint)
 
 def main():
     try:
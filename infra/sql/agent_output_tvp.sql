@@ -0,0 +1,38 @@
+-- Table type + procedure used by insert_agent_output_batch for large batches,
+-- plus the server-side created_at default. Run once against the Delfos
+-- database.
+
+-- created_at is stamped by the server so batches don't ship a timestamp
+-- parameter per row and all rows in a batch share one clock.
+ALTER TABLE [dbo].[agent_output]
+    ADD CONSTRAINT [DF_agent_output_created_at]
+    DEFAULT SYSUTCDATETIME() FOR [created_at];
+GO
+
+CREATE TYPE [dbo].[AgentOutputRow] AS TABLE (
+    [run_id]      NVARCHAR(64)   NOT NULL,
+    [user_id]     NVARCHAR(256)  NOT NULL,
+    [question]    NVARCHAR(MAX)  NOT NULL,
+    [x_value]     NVARCHAR(256)  NULL,
+    [y_value]     FLOAT          NULL,
+    [series]      NVARCHAR(256)  NULL,
+    [category]    NVARCHAR(256)  NULL,
+    [metric_name] NVARCHAR(256)  NOT NULL,
+    [visual_hint] NVARCHAR(64)   NOT NULL
+);
+GO
+
+CREATE PROCEDURE [dbo].[usp_insert_agent_output_batch]
+    @rows [dbo].[AgentOutputRow] READONLY
+AS
+BEGIN
+    SET NOCOUNT ON;
+    INSERT INTO [dbo].[agent_output]
+        ([run_id], [user_id], [question], [x_value], [y_value],
+         [series], [category], [metric_name], [visual_hint])
+    SELECT
+        [run_id], [user_id], [question], [x_value], [y_value],
+        [series], [category], [metric_name], [visual_hint]
+    FROM @rows;
+END
+GO